@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Body, status, HTTPException
-from app.models.order import OrderCreate, OrderInDB
+from app.models.order import OrderCreate, OrderInDB, OrderType, TimeInForce
 from app.core.rabbitmq import mq
 from app.core.database import get_database
 from pymongo.errors import PyMongoError
 import aio_pika
 import logging
 from typing import List
+import time
 from bson import ObjectId
 from bson.errors import InvalidId
 from eth_account import Account
@@ -26,6 +27,17 @@ async def create_order(order: OrderCreate = Body(...)):
         
         message = f"Confirm Order:\n\nAction: {order.side.value.upper()}\nQuantity: {formatted_quantity}\nSymbol: {order.symbol}\nPrice: {price_str}"
 
+        # Advanced order parameters are only part of the signed message when used,
+        # so plain limit/market orders keep the original message format.
+        if order.type in (OrderType.ICEBERG, OrderType.POST_ONLY):
+            message += f"\nType: {order.type.value.upper()}"
+        if order.display_quantity is not None:
+            message += f"\nDisplay Quantity: {order.display_quantity:.6f}"
+        if order.time_in_force != TimeInForce.GTC:
+            message += f"\nTime In Force: {order.time_in_force.value.upper()}"
+        if order.expire_at is not None:
+            message += f"\nExpires: {order.expire_at}"
+
         # 2. Encode the message in the same way MetaMask does.
         signable_message = encode_defunct(text=message)
 
@@ -47,10 +59,38 @@ async def create_order(order: OrderCreate = Body(...)):
         )
     # --- END OF VERIFICATION LOGIC ---
 
-    if order.type == "limit" and order.price is None:
+    if order.type != OrderType.MARKET and order.price is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Price must be provided for a {order.type.value} order.",
+        )
+    if order.type == OrderType.ICEBERG and (
+        order.display_quantity is None or order.display_quantity > order.quantity
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Iceberg orders need a display_quantity no larger than the total quantity.",
+        )
+    if order.type != OrderType.ICEBERG and order.display_quantity is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="display_quantity is only valid for iceberg orders.",
+        )
+    if order.type == OrderType.POST_ONLY and order.time_in_force in (TimeInForce.IOC, TimeInForce.FOK):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Post-only orders cannot be immediate-or-cancel or fill-or-kill.",
+        )
+    if order.time_in_force == TimeInForce.GTT:
+        if order.expire_at is None or order.expire_at <= time.time():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="GTT orders need an expire_at in the future.",
+            )
+    elif order.expire_at is not None:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Price must be provided for a limit order.",
+            detail="expire_at is only valid for GTT orders.",
         )
     try:
         # The rest of the function remains the same...
@@ -10,11 +10,19 @@ from bson import ObjectId
 class OrderType(str, Enum):
     MARKET = "market"
     LIMIT = "limit"
+    ICEBERG = "iceberg"
+    POST_ONLY = "post_only"
 
 class OrderSide(str, Enum):
     BUY = "buy"
     SELL = "sell"
 
+class TimeInForce(str, Enum):
+    GTC = "gtc" # Good 'til cancelled
+    IOC = "ioc" # Immediate or cancel
+    FOK = "fok" # Fill or kill
+    GTT = "gtt" # Good 'til time, see expire_at
+
 class OrderStatus(str, Enum):
     OPEN = "open"
     PARTIALLY_FILLED = "partially_filled"
@@ -27,6 +35,9 @@ class OrderBase(BaseModel):
     type: OrderType
     quantity: float = Field(..., gt=0) # Must be greater than 0
     price: Optional[float] = Field(None, gt=0) # Required for limit orders
+    time_in_force: TimeInForce = Field(default=TimeInForce.GTC)
+    display_quantity: Optional[float] = Field(None, gt=0) # Visible slice, required for iceberg orders
+    expire_at: Optional[int] = Field(None, gt=0) # Unix timestamp in seconds, required for GTT orders
 
 class OrderCreate(OrderBase):
     address: str = Field(..., example="0xAbC...123")
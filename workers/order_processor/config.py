@@ -11,6 +11,20 @@ class Settings(BaseSettings):
     SEPOLIA_RPC_URL: str
     BACKEND_WALLET_PRIVATE_KEY: str
 
+    # Resolution of the timer wheel that expires GTT orders
+    ORDER_EXPIRY_TICK_SECONDS: float = 1.0
+
+    # Optional order flow recording for the replay tool (empty disables it)
+    ORDER_FLOW_RECORD_PATH: str = ""
+    ORDER_FLOW_CHECKPOINT_INTERVAL: int = 1000
+
+    # Trade storage tiers, see trade_store.py
+    TRADES_HOT_RETENTION_SECONDS: int = 7 * 24 * 3600
+    TRADES_ROLLUP_AFTER_SECONDS: int = 3600
+    TRADES_ARCHIVE_AFTER_DAYS: int = 30
+    TRADES_ARCHIVE_DIR: str = "trade_archive"
+    TRADES_MAINTENANCE_INTERVAL_SECONDS: int = 60
+
     class Config:
         # Pydantic will look for a .env file if this is set,
         # but Docker Compose already places them in the environment.
@@ -0,0 +1,109 @@
+# workers/order_processor/order_flow.py
+
+import json
+import logging
+import mmap
+import os
+import struct
+
+# File layout: an 8 byte magic header followed by records of
+#   kind (u8) | timestamp (f64, epoch seconds) | payload length (u32) | payload
+# Records are only ever appended, so a file can be read while it is still being written.
+MAGIC = b"OFLOW01\n"
+RECORD_HEADER = struct.Struct("<BdI")
+
+SNAPSHOT = 1    # JSON list of the orders resting on the book when recording started
+MESSAGE = 2     # Raw body of a message consumed by the worker
+RESULT = 3      # JSON {"fills": [[price, quantity, settled], ...], "error": ...} of the preceding message
+EXPIRY = 4      # An expiry tick that cancelled at least one GTT order (empty payload)
+CHECKPOINT = 5  # Book hash after the preceding records
+
+
+class OrderFlowRecorder:
+    """Appends the order flow consumed by the worker to a recording file."""
+
+    def __init__(self, path: str, checkpoint_interval: int = 1000):
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = self._file.seek(0, os.SEEK_END)
+        end = self._end_of_complete_records(path, size)
+        if end < size:
+            # A crash cut the last record short. New records must follow the last complete one,
+            # otherwise the reader would take them for the rest of the broken record.
+            logging.warning(f"Dropping {size - end} byte(s) of a truncated record at the end of {path}.")
+            self._file.truncate(end)
+        self._file.seek(end)
+        if end == 0:
+            self._file.write(MAGIC)
+        self.checkpoint_interval = checkpoint_interval
+        self._messages_since_checkpoint = 0
+        logging.info(f"Recording order flow to {path}")
+
+    def _end_of_complete_records(self, path: str, size: int) -> int:
+        """Returns the offset just past the last complete record, or 0 if the header itself is incomplete."""
+        if size < len(MAGIC):
+            self._file.seek(0)
+            if MAGIC.startswith(self._file.read(size)):
+                return 0
+            raise ValueError(f"{path} is not an order flow recording.")
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an order flow recording.")
+            end = len(MAGIC)
+            for _, _, start, length in _complete_records(data):
+                end = start + length
+            return end
+
+    def _append(self, kind: int, timestamp: float, payload: bytes):
+        self._file.write(RECORD_HEADER.pack(kind, timestamp, len(payload)) + payload)
+        # Flush every record so the flow leading up to a crash is not lost in the buffer.
+        self._file.flush()
+
+    def record_snapshot(self, timestamp: float, orders: list):
+        self._append(SNAPSHOT, timestamp, json.dumps(orders, default=str).encode())
+
+    def record_message(self, timestamp: float, body: bytes, fills: list, error: str = None):
+        self._append(MESSAGE, timestamp, body)
+        result = {"fills": [[f['price'], f['quantity'], bool(f['tx_hash'])] for f in fills], "error": error}
+        self._append(RESULT, timestamp, json.dumps(result).encode())
+        self._messages_since_checkpoint += 1
+
+    def record_expiry(self, timestamp: float):
+        self._append(EXPIRY, timestamp, b"")
+
+    def checkpoint_due(self) -> bool:
+        return self._messages_since_checkpoint >= self.checkpoint_interval
+
+    def record_checkpoint(self, timestamp: float, book_hash: str):
+        self._append(CHECKPOINT, timestamp, book_hash.encode())
+        self._messages_since_checkpoint = 0
+
+    def close(self):
+        self._file.close()
+
+
+def read_order_flow(path: str):
+    """
+    Yields (kind, timestamp, payload) for every complete record in a recording.
+    The file is memory-mapped, and a record truncated by a crash ends the iteration.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an order flow recording.")
+        end = len(MAGIC)
+        for kind, timestamp, start, length in _complete_records(data):
+            yield kind, timestamp, data[start:start + length]
+            end = start + length
+        if end < len(data):
+            logging.warning(f"Recording {path} ends with a truncated record.")
+
+
+def _complete_records(data):
+    """Yields (kind, timestamp, payload offset, payload length) for each complete record after the header."""
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(data):
+            return
+        yield kind, timestamp, start, length
+        offset = start + length
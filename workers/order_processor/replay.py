@@ -0,0 +1,181 @@
+# workers/order_processor/replay.py
+#
+# Replays an order flow recording (see ORDER_FLOW_RECORD_PATH) through the MatchingEngine
+# offline, with fake settlement and an in-memory database, and checks the result against it.
+#
+#   python replay.py recording.oflow             # as fast as possible
+#   python replay.py recording.oflow --paced     # at the recorded pace
+#   python replay.py recording.oflow --paced --speed 10
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+# The engine only needs these to talk to real services, which a replay never does.
+for _name in ("MONGODB_URL", "DATABASE_NAME", "RABBITMQ_URL", "SETTLEMENT_CONTRACT_ADDRESS",
+              "SEPOLIA_RPC_URL", "BACKEND_WALLET_PRIVATE_KEY"):
+    os.environ.setdefault(_name, "unused-in-replay")
+
+from bson import ObjectId
+from pymongo.results import InsertOneResult
+
+# Local imports
+from matching_engine import MatchingEngine
+from order_flow import SNAPSHOT, MESSAGE, RESULT, EXPIRY, CHECKPOINT, read_order_flow
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the engine's writes."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        self.documents[document["_id"]] = document
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    async def insert_many(self, documents: list):
+        for document in documents:
+            await self.insert_one(document)
+
+    async def update_one(self, query: dict, update: dict):
+        document = self.documents.get(query.get("_id"))
+        if document is not None:
+            document.update(update.get("$set", {}))
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+class ReplayMatchingEngine(MatchingEngine):
+    """
+    A MatchingEngine that settles every trade instantly instead of on-chain.
+    Settlement does not affect the book, so fills are compared regardless of the recorded outcome.
+    """
+
+    def __init__(self, clock):
+        super().__init__(settle_on_chain=False, clock=clock)
+        self._tx_counter = itertools.count()
+
+    def _settle_trade_on_chain(self, symbol: str, buyer_order: dict, seller_order: dict, trade_price: float, trade_quantity: float):
+        return f"replay-{next(self._tx_counter)}"
+
+    async def publish_order_book_update(self, symbol: str):
+        # There is no market data exchange offline.
+        pass
+
+
+async def replay(path: str, paced: bool = False, speed: float = 1.0) -> dict:
+    """Replays a recording and returns a summary of throughput and any mismatches."""
+    recorded_now = [0.0]
+    clock = lambda: recorded_now[0]
+    engine = None
+    db = FakeDatabase()
+
+    stats = {"messages": 0, "trades": 0, "unsettled": 0, "errors": 0, "expiries": 0, "checkpoints": 0, "mismatches": []}
+    last_fills = None
+    first_timestamp = None
+    started = time.perf_counter()
+
+    for kind, timestamp, payload in read_order_flow(path):
+        if paced:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        recorded_now[0] = timestamp
+
+        if kind == SNAPSHOT:
+            # Every worker start writes a snapshot, so it resets the engine to that state.
+            engine = ReplayMatchingEngine(clock)
+            db = FakeDatabase()
+            for order in json.loads(payload):
+                engine.load_order(order)
+        elif kind == MESSAGE:
+            if engine is None:
+                engine = ReplayMatchingEngine(clock)
+            engine.last_fills = []
+            try:
+                await engine.process_order(json.loads(payload), db)
+            except Exception as e:
+                # Messages the worker could not process are replayed too; the RESULT record says if it failed.
+                logging.warning(f"Replay of message {stats['messages'] + 1} failed: {e}")
+            last_fills = [[f['price'], f['quantity']] for f in engine.last_fills]
+            stats["messages"] += 1
+            stats["trades"] += len(last_fills)
+        elif kind == RESULT:
+            try:
+                result = json.loads(payload)
+                recorded = result["fills"]
+                expected = [[price, quantity] for price, quantity, _ in recorded]
+            except (ValueError, KeyError, TypeError) as e:
+                stats["mismatches"].append(f"message {stats['messages']}: unreadable result record ({e})")
+                continue
+            if result.get("error"):
+                stats["errors"] += 1
+            stats["unsettled"] += sum(1 for _, _, settled in recorded if not settled)
+            if last_fills != expected:
+                stats["mismatches"].append(
+                    f"message {stats['messages']}: expected fills {expected}, replay produced {last_fills}"
+                )
+        elif kind == EXPIRY:
+            if engine is not None:
+                await engine.expire_orders(db, timestamp)
+            stats["expiries"] += 1
+        elif kind == CHECKPOINT:
+            stats["checkpoints"] += 1
+            expected = payload.decode()
+            actual = engine.book_hash() if engine else None
+            if actual != expected:
+                stats["mismatches"].append(
+                    f"checkpoint after message {stats['messages']}: expected book hash {expected}, replay has {actual}"
+                )
+        else:
+            logging.warning(f"Skipping unknown record kind {kind}.")
+
+    stats["elapsed_seconds"] = time.perf_counter() - started
+    stats["book_hash"] = engine.book_hash() if engine else None
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded order flow through the matching engine.")
+    parser.add_argument("recording", help="Path to a file written via ORDER_FLOW_RECORD_PATH")
+    parser.add_argument("--paced", action="store_true", help="Replay at the recorded pace instead of as fast as possible")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pace multiplier when --paced is given")
+    parser.add_argument("--verbose", action="store_true", help="Keep the engine's per-order logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    stats = asyncio.run(replay(args.recording, paced=args.paced, speed=args.speed))
+
+    elapsed = stats["elapsed_seconds"]
+    rate = stats["messages"] / elapsed if elapsed > 0 else 0.0
+    print(f"Replayed {stats['messages']} messages, {stats['trades']} trades and {stats['expiries']} expiry ticks in {elapsed:.3f}s ({rate:,.0f} msg/s)")
+    if stats["unsettled"]:
+        print(f"{stats['unsettled']} recorded fill(s) had failed on-chain settlement.")
+    if stats["errors"]:
+        print(f"{stats['errors']} recorded message(s) failed processing in the worker.")
+    print(f"Final book hash: {stats['book_hash']}")
+    for mismatch in stats["mismatches"]:
+        print(f"MISMATCH {mismatch}")
+    if stats["mismatches"]:
+        print(f"{len(stats['mismatches'])} mismatch(es) against the recording.")
+        sys.exit(1)
+    print(f"Trades and {stats['checkpoints']} book checkpoint(s) match the recording.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# workers/order_processor/tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+# The worker modules use flat imports from the worker directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# replay sets up the settings environment and provides the offline fakes shared with the tests.
+from replay import FakeDatabase, ReplayMatchingEngine
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_800_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestMatchingEngine(ReplayMatchingEngine):
+    """A ReplayMatchingEngine that counts the settlements it hands out."""
+
+    __test__ = False
+
+    def __init__(self, clock):
+        super().__init__(clock)
+        self.settled = 0
+
+    def _settle_trade_on_chain(self, symbol: str, buyer_order: dict, seller_order: dict, trade_price: float, trade_quantity: float):
+        self.settled += 1
+        return super()._settle_trade_on_chain(symbol, buyer_order, seller_order, trade_price, trade_quantity)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def engine(clock):
+    return TestMatchingEngine(clock)
+
+
+@pytest.fixture
+def db():
+    return FakeDatabase()
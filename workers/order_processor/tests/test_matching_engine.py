@@ -0,0 +1,163 @@
+# workers/order_processor/tests/test_matching_engine.py
+
+import asyncio
+
+import pytest
+
+SYMBOL = "BTC/USDT"
+
+
+def submit(engine, db, side, quantity, price, **extra):
+    order = {"symbol": SYMBOL, "side": side, "type": "limit", "quantity": quantity, "price": price,
+             "address": f"0x{side}{price}", **extra}
+    return asyncio.run(engine.process_order(order, db))
+
+
+def resting(engine, book_side):
+    return [entry[2] for entry in sorted(engine.order_book[SYMBOL][book_side], key=lambda entry: entry[:2])
+            if entry[2].get("status") != "cancelled"]
+
+
+def fills(trades):
+    return [(t["price"], t["quantity"]) for t in trades]
+
+
+def test_iceberg_rests_only_its_display_slice(engine, db):
+    submit(engine, db, "sell", 10, 100, type="iceberg", display_quantity=2)
+
+    [iceberg] = resting(engine, "asks")
+    assert float(iceberg["quantity"]) == 2
+    assert float(iceberg["hidden_quantity"]) == 8
+
+
+def test_iceberg_refill_loses_time_priority(engine, db):
+    submit(engine, db, "sell", 10, 100, type="iceberg", display_quantity=2, address="iceberg")
+    submit(engine, db, "sell", 1, 100, address="later")
+
+    trades = submit(engine, db, "buy", 3, 100)
+
+    # The first slice trades first, but its refill queues behind the order that arrived later.
+    assert fills(trades) == [(100.0, 2.0), (100.0, 1.0)]
+    [iceberg] = resting(engine, "asks")
+    assert iceberg["address"] == "iceberg"
+    assert float(iceberg["quantity"]) == 2
+    assert float(iceberg["hidden_quantity"]) == 6
+
+
+@pytest.mark.parametrize("total, display, slices", [(1.0, 0.1, 10), (3.0, 0.3, 10), (0.7, 0.1, 7)])
+def test_iceberg_refills_do_not_leave_dust(engine, db, total, display, slices):
+    submit(engine, db, "sell", total, 100, type="iceberg", display_quantity=display)
+
+    trades = submit(engine, db, "buy", total, 100)
+
+    assert len(trades) == slices
+    assert resting(engine, "asks") == []
+    assert resting(engine, "bids") == []
+
+
+def test_fok_fills_against_hidden_reserve(engine, db):
+    submit(engine, db, "sell", 10, 100, type="iceberg", display_quantity=2)
+
+    trades = submit(engine, db, "buy", 7, 100, time_in_force="fok")
+
+    assert sum(quantity for _, quantity in fills(trades)) == 7
+    [iceberg] = resting(engine, "asks")
+    assert float(iceberg["quantity"]) + float(iceberg["hidden_quantity"]) == 3
+
+
+def test_fok_is_killed_when_book_cannot_fill_it(engine, db):
+    submit(engine, db, "sell", 10, 100, type="iceberg", display_quantity=2)
+    submit(engine, db, "sell", 5, 101)
+
+    trades = submit(engine, db, "buy", 11, 100, time_in_force="fok")
+
+    assert trades == []
+    assert resting(engine, "bids") == []
+    assert [float(o["quantity"]) for o in resting(engine, "asks")] == [2, 5]
+
+
+def test_ioc_remainder_is_not_rested(engine, db):
+    submit(engine, db, "sell", 2, 100)
+
+    trades = submit(engine, db, "buy", 5, 100, time_in_force="ioc")
+
+    assert fills(trades) == [(100.0, 2.0)]
+    assert resting(engine, "bids") == []
+
+
+def test_post_only_is_rejected_when_it_would_cross(engine, db):
+    submit(engine, db, "sell", 1, 100)
+
+    trades = submit(engine, db, "buy", 1, 100, type="post_only")
+
+    assert trades == []
+    assert resting(engine, "bids") == []
+    assert len(resting(engine, "asks")) == 1
+
+
+def test_post_only_rests_when_it_does_not_cross(engine, db):
+    submit(engine, db, "sell", 1, 100)
+
+    submit(engine, db, "buy", 1, 99, type="post_only")
+
+    assert [o["price"] for o in resting(engine, "bids")] == [99]
+
+
+def test_gtt_expires_after_more_than_one_wheel_revolution(engine, db, clock):
+    revolution = len(engine.expiry_wheel.slots) * engine.expiry_wheel.tick_seconds
+    submit(engine, db, "buy", 1, 90, time_in_force="gtt", expire_at=int(clock.now + revolution + 100))
+
+    # Tick through the first revolution; the order's slot is visited but it is not due yet.
+    for _ in range(int(revolution) + 50):
+        clock.now += 1
+        asyncio.run(engine.expire_orders(db))
+    assert len(resting(engine, "bids")) == 1
+
+    clock.now += 100
+    assert asyncio.run(engine.expire_orders(db)) == 1
+    assert resting(engine, "bids") == []
+
+
+def test_gtt_expires_after_a_long_pause(engine, db, clock):
+    submit(engine, db, "buy", 1, 90, time_in_force="gtt", expire_at=int(clock.now + 10))
+    submit(engine, db, "buy", 1, 91)
+
+    clock.now += 100_000
+    assert asyncio.run(engine.expire_orders(db)) == 1
+    assert [o["price"] for o in resting(engine, "bids")] == [91]
+
+
+def test_gtt_arriving_after_its_expiry_is_discarded(engine, db, clock):
+    submit(engine, db, "buy", 1, 90, time_in_force="gtt", expire_at=int(clock.now - 1))
+
+    assert resting(engine, "bids") == []
+
+
+def test_expired_orders_away_from_the_top_are_compacted(engine, db, clock):
+    submit(engine, db, "buy", 1, 95)
+    for price in range(81, 91):
+        submit(engine, db, "buy", 1, price, time_in_force="gtt", expire_at=int(clock.now + 10))
+
+    clock.now += 20
+    assert asyncio.run(engine.expire_orders(db)) == 10
+
+    assert len(engine.order_book[SYMBOL]["bids"]) == 1
+
+
+def test_filled_gtt_order_is_taken_off_the_wheel(engine, db, clock):
+    submit(engine, db, "sell", 1, 100, time_in_force="gtt", expire_at=int(clock.now + 10))
+
+    submit(engine, db, "buy", 1, 100)
+
+    assert all(not slot for slot in engine.expiry_wheel.slots)
+
+
+def test_unsettled_fills_are_reported_but_not_saved(engine, db):
+    engine._settle_trade_on_chain = lambda **kwargs: None
+    submit(engine, db, "sell", 1, 100)
+
+    trades = submit(engine, db, "buy", 1, 100)
+
+    assert [t["tx_hash"] for t in trades] == [None]
+    assert db["trades"].documents == {}
+    assert resting(engine, "asks") == []
@@ -0,0 +1,175 @@
+# workers/order_processor/tests/test_order_flow.py
+
+import asyncio
+import json
+
+import pytest
+
+from conftest import TestMatchingEngine
+from config import settings
+from order_flow import MESSAGE, RESULT, SNAPSHOT, read_order_flow, OrderFlowRecorder
+from replay import FakeDatabase, replay
+from worker import process_message
+
+SYMBOL = "BTC/USDT"
+
+
+class SlowDatabase(FakeDatabase):
+    """Resting orders take a while to save, so later messages can finish processing first."""
+
+    def __missing__(self, name):
+        collection = super().__missing__(name)
+        insert_one = collection.insert_one
+
+        async def slow_insert_one(document):
+            await asyncio.sleep(0.05)
+            return await insert_one(document)
+
+        collection.insert_one = slow_insert_one
+        return collection
+
+
+class FakeMessage:
+    def __init__(self, order: dict):
+        self.body = json.dumps(order).encode()
+
+    def process(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def order(side, quantity, price, **extra):
+    return {"symbol": SYMBOL, "side": side, "type": "limit", "quantity": quantity, "price": price,
+            "address": f"0x{side}{price}", **extra}
+
+
+async def record(path, orders, engine, db, checkpoint_interval=1):
+    recorder = OrderFlowRecorder(str(path), checkpoint_interval=checkpoint_interval)
+    recorder.record_snapshot(engine.clock(), engine.resting_orders())
+    db_client = {settings.DATABASE_NAME: db}
+    # Consumer callbacks run concurrently, exactly as aio_pika dispatches them.
+    await asyncio.gather(*(process_message(FakeMessage(o), db_client, engine, recorder) for o in orders))
+    recorder.close()
+
+
+def test_concurrent_messages_are_recorded_in_matching_order(tmp_path, clock):
+    path = tmp_path / "flow.oflow"
+    engine = TestMatchingEngine(clock)
+    orders = [order("sell", 1, 100), order("buy", 1, 100), order("sell", 2, 101), order("buy", 3, 101)]
+
+    asyncio.run(record(path, orders, engine, SlowDatabase()))
+
+    recorded = [json.loads(payload) for kind, _, payload in read_order_flow(str(path)) if kind == MESSAGE]
+    assert [(o["side"], o["price"]) for o in recorded] == [(o["side"], o["price"]) for o in orders]
+
+    stats = asyncio.run(replay(str(path)))
+    assert stats["mismatches"] == []
+    assert stats["messages"] == len(orders)
+    assert stats["book_hash"] == engine.book_hash()
+
+
+class FlakySettlementEngine(TestMatchingEngine):
+    """Every other settlement fails, as it would on a congested or unreachable RPC node."""
+
+    __test__ = False
+
+    def _settle_trade_on_chain(self, *args, **kwargs):
+        tx_hash = super()._settle_trade_on_chain(*args, **kwargs)
+        return tx_hash if self.settled % 2 else None
+
+
+def test_recording_with_failed_settlements_replays_cleanly(tmp_path, clock):
+    path = tmp_path / "flow.oflow"
+    engine = FlakySettlementEngine(clock)
+    orders = [order("sell", 1, 100), order("sell", 1, 100), order("sell", 1, 100), order("buy", 3, 100)]
+
+    asyncio.run(record(path, orders, engine, FakeDatabase()))
+
+    stats = asyncio.run(replay(str(path)))
+    assert stats["mismatches"] == []
+    assert stats["trades"] == 3
+    assert stats["unsettled"] == 1
+
+
+class RawMessage(FakeMessage):
+    def __init__(self, body: bytes):
+        self.body = body
+
+
+def test_messages_that_fail_processing_are_still_recorded(tmp_path, clock):
+    path = tmp_path / "flow.oflow"
+    engine = TestMatchingEngine(clock)
+    db = FakeDatabase()
+
+    async def failing_insert_many(documents):
+        raise RuntimeError("trades collection unavailable")
+
+    db["trades"].insert_many = failing_insert_many
+
+    async def run():
+        recorder = OrderFlowRecorder(str(path), checkpoint_interval=1)
+        recorder.record_snapshot(engine.clock(), engine.resting_orders())
+        db_client = {settings.DATABASE_NAME: db}
+        # Both buys match and change the book before saving their trade fails.
+        for message in (FakeMessage(order("sell", 2, 100)), FakeMessage(order("buy", 1, 100)),
+                        RawMessage(b"not json"), FakeMessage(order("buy", 1, 100))):
+            await process_message(message, db_client, engine, recorder)
+        recorder.close()
+
+    asyncio.run(run())
+
+    stats = asyncio.run(replay(str(path)))
+    assert stats["messages"] == 4
+    assert stats["errors"] == 3
+    assert stats["trades"] == 2
+    assert stats["mismatches"] == []
+
+
+def test_recorder_drops_a_truncated_record_before_appending(tmp_path, clock):
+    path = tmp_path / "flow.oflow"
+    recorder = OrderFlowRecorder(str(path))
+    recorder.record_snapshot(clock.now, [])
+    recorder.record_message(clock.now, json.dumps(order("sell", 1, 100)).encode(), [])
+    recorder.close()
+    # Simulate a crash in the middle of writing the RESULT record.
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 5)
+
+    recorder = OrderFlowRecorder(str(path))
+    recorder.record_snapshot(clock.now, [])
+    for price in range(100, 105):
+        recorder.record_message(clock.now, json.dumps(order("sell", 1, price)).encode(), [])
+    recorder.close()
+
+    kinds = [kind for kind, _, _ in read_order_flow(str(path))]
+    assert kinds == [SNAPSHOT, MESSAGE, SNAPSHOT] + [MESSAGE, RESULT] * 5
+
+
+def test_recorder_refuses_to_append_to_other_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not an order flow recording")
+
+    with pytest.raises(ValueError):
+        OrderFlowRecorder(str(path))
+    assert path.read_bytes() == b"not an order flow recording"
+
+
+def test_replay_reports_a_corrupt_result_record(tmp_path, clock):
+    path = tmp_path / "flow.oflow"
+    recorder = OrderFlowRecorder(str(path))
+    recorder.record_snapshot(clock.now, [])
+    recorder._append(MESSAGE, clock.now, json.dumps(order("sell", 1, 100)).encode())
+    recorder._append(RESULT, clock.now, b'{"fills": [[100.0')
+    recorder.record_message(clock.now, json.dumps(order("buy", 1, 100)).encode(), [{"price": 100.0, "quantity": 1.0, "tx_hash": "0x1"}])
+    recorder.close()
+
+    stats = asyncio.run(replay(str(path)))
+
+    assert stats["messages"] == 2
+    assert len(stats["mismatches"]) == 1
+    assert "unreadable result record" in stats["mismatches"][0]
@@ -0,0 +1,41 @@
+# workers/order_processor/tests/test_timer_wheel.py
+
+from timer_wheel import TimerWheel
+
+
+def test_item_never_fires_early():
+    wheel = TimerWheel(tick_seconds=1.0, num_slots=8, start=100.0)
+    wheel.schedule(105.5, "order")
+
+    assert wheel.advance(105.9) == []
+    assert wheel.advance(106.0) == ["order"]
+
+
+def test_item_beyond_one_revolution_waits_for_its_round():
+    wheel = TimerWheel(tick_seconds=1.0, num_slots=8, start=100.0)
+    wheel.schedule(120.0, "order")
+
+    for now in range(101, 120):
+        assert wheel.advance(now) == []
+    assert wheel.advance(120.0) == ["order"]
+
+
+def test_long_pause_returns_everything_due_once():
+    wheel = TimerWheel(tick_seconds=1.0, num_slots=8, start=100.0)
+    for expire_at in (101.0, 104.0, 150.0):
+        wheel.schedule(expire_at, expire_at)
+    wheel.schedule(10_000.0, "later")
+
+    assert sorted(wheel.advance(1_000.0)) == [101.0, 104.0, 150.0]
+    assert wheel.advance(1_000.0) == []
+    assert wheel.advance(10_000.0) == ["later"]
+
+
+def test_cancelled_item_does_not_fire():
+    wheel = TimerWheel(tick_seconds=1.0, num_slots=8, start=100.0)
+    item = {"id": 1}
+    due_tick = wheel.schedule(103.0, item)
+
+    assert wheel.cancel(due_tick, item)
+    assert not wheel.cancel(due_tick, item)
+    assert wheel.advance(200.0) == []
@@ -0,0 +1,156 @@
+# workers/order_processor/tests/test_trade_store.py
+
+import asyncio
+from datetime import datetime, timezone
+
+import pyarrow.parquet as pq
+
+import trade_store
+from config import settings
+from trade_store import MINUTE_BAR_SCHEMA, MINUTE_BARS_COLLECTION, TRADES_COLLECTION
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def sort(self, key, direction):
+        self.documents.sort(key=lambda document: document[key], reverse=direction < 0)
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = document[field]
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+        elif ("$gte" in condition and value < condition["$gte"]) or ("$lt" in condition and value >= condition["$lt"]):
+            return False
+    return True
+
+
+class ScriptedCollection:
+    """Answers aggregations with a canned result and otherwise behaves like a small Motor collection."""
+
+    def __init__(self, calls, aggregate_result=(), documents=()):
+        self.calls = calls
+        self.aggregate_result = list(aggregate_result)
+        self.documents = list(documents)
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor(self.aggregate_result)
+
+    async def find_one(self, query, sort=None):
+        documents = FakeCursor(self.documents).sort(*sort[0]).documents if sort else self.documents
+        return documents[0] if documents else None
+
+    def find(self, query):
+        return FakeCursor(document for document in self.documents if _matches(document, query))
+
+    async def insert_many(self, documents):
+        self.calls.append(("insert_many", len(documents)))
+        self.documents.extend(documents)
+
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        self.documents = [document for document in self.documents if not _matches(document, query)]
+
+
+def bar(symbol, minute, close=100.0):
+    return {"symbol": symbol, "minute": minute, "open": 99.0, "high": 101.0, "low": 98.0, "close": close,
+            "volume": 2.0, "notional": 200.0, "trade_count": 3}
+
+
+NOW = datetime(2026, 10, 19, 12, 34, 56, 789000, tzinfo=timezone.utc)
+
+
+def test_rollup_stops_at_the_cutoff_minute_and_redoes_the_newest_bar(monkeypatch):
+    monkeypatch.setattr(settings, "TRADES_ROLLUP_AFTER_SECONDS", 3600)
+    calls = []
+    newest = datetime(2026, 10, 19, 11, 30)
+    bars = ScriptedCollection(calls, documents=[bar("BTC/USDT", datetime(2026, 10, 19, 11, 29)), bar("BTC/USDT", newest)])
+    trades = ScriptedCollection(calls, aggregate_result=[bar("BTC/USDT", newest), bar("BTC/USDT", datetime(2026, 10, 19, 11, 31))])
+    db = {TRADES_COLLECTION: trades, MINUTE_BARS_COLLECTION: bars}
+
+    assert asyncio.run(trade_store.rollup_trades(db, NOW)) == 2
+
+    window = trades.pipelines[0][0]["$match"]["timestamp"]
+    assert window == {"$gte": newest, "$lt": datetime(2026, 10, 19, 11, 34, tzinfo=timezone.utc)}
+    # The newest minute is removed before being written again, so it is never stored twice.
+    assert calls == [("delete_many", {"minute": {"$gte": newest}}), ("insert_many", 2)]
+    assert sorted(b["minute"].minute for b in bars.documents) == [29, 30, 31]
+
+
+def test_first_rollup_has_no_lower_bound(monkeypatch):
+    monkeypatch.setattr(settings, "TRADES_ROLLUP_AFTER_SECONDS", 60)
+    calls = []
+    trades = ScriptedCollection(calls, aggregate_result=[bar("BTC/USDT", datetime(2026, 10, 19, 12, 0))])
+    db = {TRADES_COLLECTION: trades, MINUTE_BARS_COLLECTION: ScriptedCollection(calls)}
+
+    asyncio.run(trade_store.rollup_trades(db, NOW))
+
+    assert trades.pipelines[0][0]["$match"]["timestamp"] == {"$lt": datetime(2026, 10, 19, 12, 33, tzinfo=timezone.utc)}
+    assert calls == [("insert_many", 1)]
+
+
+def test_rollup_without_new_trades_writes_nothing():
+    calls = []
+    db = {TRADES_COLLECTION: ScriptedCollection(calls), MINUTE_BARS_COLLECTION: ScriptedCollection(calls)}
+
+    assert asyncio.run(trade_store.rollup_trades(db, NOW)) == 0
+    assert calls == []
+
+
+def test_archive_writes_one_file_per_symbol_and_day_and_deletes_the_bars(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "TRADES_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "TRADES_ARCHIVE_AFTER_DAYS", 30)
+    day = datetime(2026, 9, 1)
+    recent = bar("BTC/USDT", datetime(2026, 10, 1, 0, 0))
+    bars = ScriptedCollection(
+        [],
+        aggregate_result=[{"_id": {"symbol": "BTC/USDT", "day": day}}, {"_id": {"symbol": "ETH/USDT", "day": day}}],
+        documents=[bar("BTC/USDT", datetime(2026, 9, 1, 0, 1)), bar("BTC/USDT", datetime(2026, 9, 1, 23, 59)),
+                   bar("ETH/USDT", datetime(2026, 9, 1, 12, 0)), bar("BTC/USDT", datetime(2026, 9, 2, 0, 0)), recent],
+    )
+    db = {MINUTE_BARS_COLLECTION: bars}
+
+    assert asyncio.run(trade_store.archive_minute_bars(db, NOW)) == 2
+
+    assert bars.pipelines[0][0]["$match"] == {"minute": {"$lt": datetime(2026, 9, 19, tzinfo=timezone.utc)}}
+    assert pq.read_table(tmp_path / "BTC-USDT" / "2026-09-01.parquet").num_rows == 2
+    assert pq.read_table(tmp_path / "ETH-USDT" / "2026-09-01.parquet").num_rows == 1
+    # Only the archived symbol/day partitions are removed from MongoDB.
+    assert [b["minute"] for b in bars.documents] == [datetime(2026, 9, 2, 0, 0), recent["minute"]]
+
+
+def test_parquet_file_reads_back_with_the_minute_bar_schema(tmp_path):
+    path = tmp_path / "BTC-USDT" / "2026-09-01.parquet"
+    bars = [bar("BTC/USDT", datetime(2026, 9, 1, 0, minute), close=100.0 + minute) for minute in range(3)]
+
+    trade_store._write_parquet(str(path), bars)
+
+    table = pq.read_table(path)
+    assert table.schema.equals(MINUTE_BAR_SCHEMA)
+    assert table.column("minute").to_pylist() == [datetime(2026, 9, 1, 0, m, tzinfo=timezone.utc) for m in range(3)]
+    assert table.column("close").to_pylist() == [100.0, 101.0, 102.0]
+    assert table.column("trade_count").to_pylist() == [3, 3, 3]
+    assert not path.with_name(path.name + ".tmp").exists()
+
+
+def test_archiving_a_day_again_merges_with_the_existing_file(tmp_path):
+    path = tmp_path / "BTC-USDT" / "2026-09-01.parquet"
+    trade_store._write_parquet(str(path), [bar("BTC/USDT", datetime(2026, 9, 1, 0, m)) for m in (0, 1)])
+
+    # A late rollup for the same day, plus a bar re-exported after a crash before its delete.
+    trade_store._write_parquet(str(path), [bar("BTC/USDT", datetime(2026, 9, 1, 0, 1), close=105.0),
+                                           bar("BTC/USDT", datetime(2026, 9, 1, 0, 2))])
+
+    table = pq.read_table(path)
+    assert [m.minute for m in table.column("minute").to_pylist()] == [0, 1, 2]
+    assert table.column("close").to_pylist() == [100.0, 105.0, 100.0]
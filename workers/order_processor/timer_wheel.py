@@ -0,0 +1,60 @@
+# workers/order_processor/timer_wheel.py
+
+import math
+import time
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel used by the matching engine to expire GTT orders.
+
+    Scheduling is O(1) and advancing only visits the slots for the ticks that
+    have elapsed, so expiry cost does not grow with the size of the book.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, num_slots: int = 3600, start: float = None):
+        self.tick_seconds = tick_seconds
+        self.slots = [[] for _ in range(num_slots)]
+        self.current_tick = int((time.time() if start is None else start) // tick_seconds)
+
+    def schedule(self, expire_at: float, item) -> int:
+        """
+        Schedules an item to be returned by advance() once expire_at (epoch seconds) has passed.
+        Returns the tick it was scheduled for, which cancel() needs.
+        """
+        # Round up so an item never fires early, and never land in a slot we have already visited.
+        due_tick = max(math.ceil(expire_at / self.tick_seconds), self.current_tick + 1)
+        self.slots[due_tick % len(self.slots)].append((due_tick, item))
+        return due_tick
+
+    def cancel(self, due_tick: int, item) -> bool:
+        """Removes a scheduled item before it fires. Returns False if it was not pending."""
+        slot = self.slots[due_tick % len(self.slots)]
+        for index, (tick, pending) in enumerate(slot):
+            if tick == due_tick and pending is item:
+                del slot[index]
+                return True
+        return False
+
+    def advance(self, now: float = None) -> list:
+        """Moves the wheel forward to 'now' and returns every item that has become due."""
+        target_tick = int((time.time() if now is None else now) // self.tick_seconds)
+        expired = []
+
+        # After a long pause one full revolution is enough to see every pending item.
+        steps = min(target_tick - self.current_tick, len(self.slots))
+        for offset in range(1, steps + 1):
+            slot_index = (self.current_tick + offset) % len(self.slots)
+            slot = self.slots[slot_index]
+            if not slot:
+                continue
+            remaining = []
+            for due_tick, item in slot:
+                if due_tick <= target_tick:
+                    expired.append(item)
+                else:
+                    remaining.append((due_tick, item))
+            self.slots[slot_index] = remaining
+
+        self.current_tick = max(self.current_tick, target_tick)
+        return expired
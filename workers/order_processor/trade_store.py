@@ -0,0 +1,168 @@
+# workers/order_processor/trade_store.py
+#
+# Storage tiers for executed trades:
+#   trades     - raw fills in a time-series collection, removed by TTL after TRADES_HOT_RETENTION_SECONDS
+#   trades_1m  - per-minute OHLCV aggregates rolled up from the raw fills after TRADES_ROLLUP_AFTER_SECONDS
+#   archive    - daily Parquet files of the aggregates older than TRADES_ARCHIVE_AFTER_DAYS, removed from MongoDB
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo.errors import CollectionInvalid
+
+# Local imports
+from config import settings
+
+TRADES_COLLECTION = "trades"
+MINUTE_BARS_COLLECTION = "trades_1m"
+
+MINUTE_BAR_SCHEMA = pa.schema([
+    ("minute", pa.timestamp("ms", tz="UTC")),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+    ("notional", pa.float64()),
+    ("trade_count", pa.int64()),
+])
+
+
+async def _create_time_series(db, name: str, time_field: str, granularity: str, expire_after_seconds: int = None):
+    options = {"timeseries": {"timeField": time_field, "metaField": "symbol", "granularity": granularity}}
+    if expire_after_seconds:
+        options["expireAfterSeconds"] = expire_after_seconds
+    try:
+        await db.create_collection(name, **options)
+        logging.info(f"Created time-series collection '{name}'.")
+    except CollectionInvalid:
+        # Already exists. A plain collection left over from before cannot be converted in place.
+        info = await db.command("listCollections", filter={"name": name})
+        collections = info["cursor"]["firstBatch"]
+        if collections and collections[0].get("type") != "timeseries":
+            logging.warning(f"Collection '{name}' exists but is not a time-series collection. Rename or drop it to migrate.")
+
+
+async def ensure_trade_collections(db):
+    """Creates the trade collections as time-series collections keyed by symbol if they do not exist yet."""
+    if settings.TRADES_ROLLUP_AFTER_SECONDS >= settings.TRADES_HOT_RETENTION_SECONDS:
+        logging.warning("TRADES_ROLLUP_AFTER_SECONDS should be below TRADES_HOT_RETENTION_SECONDS, "
+                        "otherwise raw trades can expire before they are rolled up.")
+    await _create_time_series(db, TRADES_COLLECTION, "timestamp", "seconds", settings.TRADES_HOT_RETENTION_SECONDS)
+    await _create_time_series(db, MINUTE_BARS_COLLECTION, "minute", "minutes")
+
+
+def _floor_minute(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+async def rollup_trades(db, now: datetime = None) -> int:
+    """
+    Aggregates raw trades older than TRADES_ROLLUP_AFTER_SECONDS into per-minute bars.
+    Returns the number of bars written.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = _floor_minute(now - timedelta(seconds=settings.TRADES_ROLLUP_AFTER_SECONDS))
+
+    # Redo the newest rolled-up minute in case the previous run was interrupted half way through it.
+    latest = await db[MINUTE_BARS_COLLECTION].find_one({}, sort=[("minute", -1)])
+    time_range = {"$lt": cutoff}
+    if latest:
+        time_range["$gte"] = latest["minute"]
+
+    pipeline = [
+        {"$match": {"timestamp": time_range}},
+        {"$sort": {"timestamp": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"symbol": "$symbol", "minute": {"$dateTrunc": {"date": "$timestamp", "unit": "minute"}}},
+            "open": {"$first": "$price"},
+            "high": {"$max": "$price"},
+            "low": {"$min": "$price"},
+            "close": {"$last": "$price"},
+            "volume": {"$sum": "$quantity"},
+            "notional": {"$sum": {"$multiply": ["$price", "$quantity"]}},
+            "trade_count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0, "symbol": "$_id.symbol", "minute": "$_id.minute",
+            "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1, "notional": 1, "trade_count": 1,
+        }},
+        {"$sort": {"minute": 1, "symbol": 1}},
+    ]
+    bars = await db[TRADES_COLLECTION].aggregate(pipeline).to_list(length=None)
+    if not bars:
+        return 0
+
+    if latest:
+        await db[MINUTE_BARS_COLLECTION].delete_many({"minute": {"$gte": latest["minute"]}})
+    await db[MINUTE_BARS_COLLECTION].insert_many(bars)
+    logging.info(f"Rolled up trades into {len(bars)} minute bar(s) up to {cutoff.isoformat()}.")
+    return len(bars)
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # MongoDB hands back naive UTC datetimes, Parquet reads back aware ones.
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def _write_parquet(path: str, bars: list):
+    """
+    Merges minute bars into a Parquet file, replacing it atomically so a crash never leaves half a file.
+    Bars already in the file are kept unless a new bar covers the same minute.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    merged = {}
+    if os.path.exists(path):
+        for row in pq.read_table(path, schema=MINUTE_BAR_SCHEMA).to_pylist():
+            merged[_as_utc(row["minute"])] = row
+    for bar in bars:
+        merged[_as_utc(bar["minute"])] = bar
+    rows = [merged[minute] for minute in sorted(merged)]
+    table = pa.table({name: [row[name] for row in rows] for name in MINUTE_BAR_SCHEMA.names}, schema=MINUTE_BAR_SCHEMA)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+async def archive_minute_bars(db, now: datetime = None) -> int:
+    """
+    Moves minute bars from days older than TRADES_ARCHIVE_AFTER_DAYS into one Parquet file
+    per symbol and day under TRADES_ARCHIVE_DIR. Returns the number of files written.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff_day = (now - timedelta(days=settings.TRADES_ARCHIVE_AFTER_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    pipeline = [
+        {"$match": {"minute": {"$lt": cutoff_day}}},
+        {"$group": {"_id": {"symbol": "$symbol", "day": {"$dateTrunc": {"date": "$minute", "unit": "day"}}}}},
+        {"$sort": {"_id.day": 1, "_id.symbol": 1}},
+    ]
+    partitions = await db[MINUTE_BARS_COLLECTION].aggregate(pipeline).to_list(length=None)
+
+    for partition in partitions:
+        symbol, day = partition["_id"]["symbol"], partition["_id"]["day"]
+        day_range = {"$gte": day, "$lt": day + timedelta(days=1)}
+        bars = await db[MINUTE_BARS_COLLECTION].find({"symbol": symbol, "minute": day_range}).sort("minute", 1).to_list(length=None)
+
+        path = os.path.join(settings.TRADES_ARCHIVE_DIR, symbol.replace("/", "-"), f"{day:%Y-%m-%d}.parquet")
+        # Bars are merged by minute, so exporting the same day again after a crash or a late rollup loses nothing.
+        await asyncio.to_thread(_write_parquet, path, bars)
+        await db[MINUTE_BARS_COLLECTION].delete_many({"symbol": symbol, "minute": day_range})
+        logging.info(f"Archived {len(bars)} minute bar(s) for {symbol} on {day:%Y-%m-%d} to {path}.")
+
+    return len(partitions)
+
+
+async def run_trade_maintenance_loop(db):
+    """Periodically rolls up and archives trades. Runs for the lifetime of the worker."""
+    while True:
+        try:
+            await rollup_trades(db)
+            await archive_minute_bars(db)
+        except Exception as e:
+            logging.error(f"Trade maintenance failed: {e}")
+        await asyncio.sleep(settings.TRADES_MAINTENANCE_INTERVAL_SECONDS)
@@ -9,6 +9,8 @@ import aio_pika
 # Local imports for the worker
 from config import settings
 from matching_engine import MatchingEngine
+from order_flow import OrderFlowRecorder
+from trade_store import ensure_trade_collections, run_trade_maintenance_loop
 
 # The name of the queue this worker will consume from
 QUEUE_NAME = "order_processing_queue"
@@ -17,12 +19,16 @@ QUEUE_NAME = "order_processing_queue"
 logging.basicConfig(level=logging.INFO)
 
 
-async def process_message(message: aio_pika.IncomingMessage, db_client: AsyncIOMotorClient, engine: MatchingEngine):
+async def process_message(message: aio_pika.IncomingMessage, db_client: AsyncIOMotorClient, engine: MatchingEngine, recorder: OrderFlowRecorder = None):
     """
     This is the callback function that gets executed for each message.
     """
     # Acknowledge the message so RabbitMQ knows it's been processed
-    async with message.process():
+    # The engine lock keeps matching and recording in one order across concurrent callbacks
+    async with message.process(), engine.lock:
+        received_at = engine.clock()
+        engine.last_fills = []
+        error = None
         try:
             body = message.body.decode()
             order_data = json.loads(body)
@@ -32,8 +38,18 @@ async def process_message(message: aio_pika.IncomingMessage, db_client: AsyncIOM
             await engine.process_order(order_data, db_client[settings.DATABASE_NAME])
 
         except Exception as e:
+            error = str(e)
             logging.error(f"Worker failed to process message: {e}")
 
+        # Every consumed message is recorded, even if processing failed after changing the book
+        if recorder:
+            try:
+                recorder.record_message(received_at, message.body, engine.last_fills, error)
+                if recorder.checkpoint_due():
+                    recorder.record_checkpoint(engine.clock(), engine.book_hash())
+            except Exception as e:
+                logging.error(f"Worker failed to record message: {e}")
+
 
 async def main():
     """Main function to set up connections and start the worker."""
@@ -62,13 +78,28 @@ async def main():
         # Give the engine a reference to this exchange so it can publish updates
         engine.set_market_data_exchange(market_data_exchange)
         
+        # Make sure trades are stored in time-series collections before any are written
+        await ensure_trade_collections(db_client[settings.DATABASE_NAME])
+
         # Load existing orders from the database into the engine's memory on startup
         await engine.load_orders_from_db(db_client[settings.DATABASE_NAME])
+
+        # Optionally record the order flow so it can be replayed offline with replay.py
+        recorder = None
+        if settings.ORDER_FLOW_RECORD_PATH:
+            recorder = OrderFlowRecorder(settings.ORDER_FLOW_RECORD_PATH, settings.ORDER_FLOW_CHECKPOINT_INTERVAL)
+            recorder.record_snapshot(engine.clock(), engine.resting_orders())
+
+        # Expire GTT orders in the background using the engine's timer wheel
+        expiry_task = asyncio.create_task(engine.run_expiry_loop(db_client[settings.DATABASE_NAME], recorder))
+
+        # Roll up old trades into minute bars and archive old bars to Parquet in the background
+        trade_maintenance_task = asyncio.create_task(run_trade_maintenance_loop(db_client[settings.DATABASE_NAME]))
         
         logging.info("Worker is waiting for messages...")
         
         # Start consuming messages from the queue and passing them to our callback
-        await order_queue.consume(lambda message: process_message(message, db_client, engine))
+        await order_queue.consume(lambda message: process_message(message, db_client, engine, recorder))
 
         # This is the critical line that keeps the worker running forever
         await asyncio.Future()